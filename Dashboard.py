@@ -1,9 +1,12 @@
 import streamlit as st
 import database_sq as db
+import api_interactions as api
 import utils
 from trade import Trade
 from datetime import datetime
 import time
+import pandas as pd
+import numpy as np
 
 # --- Auth --- #
 def check_password():
@@ -31,31 +34,6 @@ st.markdown("""
     [data-testid="stMetricLabel"] { font-size: 0.8rem !important; }
     [data-testid="stMetricValue"] { font-size: 1.1rem !important; }
     [data-testid="stMetric"] { padding: 0px !important; }
-
-    /* Target by Aria-Label (Matches the exact text inside st.button) */
-    
-    /* Update Button */
-    button[aria-label="Update Trade"] {
-        background-color: #0971B2 !important;
-        color: white !important;
-        border: none !important;
-    }
-
-    /* Delete Button */
-    button[aria-label="Delete Trade"] {
-        background-color: #8b0000 !important;
-        color: white !important;
-        border: none !important;
-    }
-
-    /* Hover States */
-    button[aria-label="Update Trade"]:hover {
-        background-color: #0a85d4 !important;
-    }
-    
-    button[aria-label="Delete Trade"]:hover {
-        background-color: #a30000 !important;
-    }
     </style>
 """, unsafe_allow_html=True)
 
@@ -86,6 +64,10 @@ with st.sidebar:
     )
     st.session_state.active_portfolio = selected_p
 
+    # Load the portfolio once per run; everything below reuses it.
+    # (st.cache_data hands back a fresh copy, i.e. a full decode, on every call)
+    cash, trades = db.get_portfolio_snapshot(selected_p)
+
     st.divider()
 
     # 2. PORTFOLIO ACTIONS (Create/Delete)
@@ -128,7 +110,7 @@ with st.sidebar:
     with st.expander("Add New Trade"):
         with st.form("add_trade"):
             t_type = st.selectbox("Type", ["shares", "csp", "cc", "short_call", "short_put", "long_call", "long_put"])
-            ticker = st.text_input("Ticker")
+            ticker = st.text_input("Ticker", max_chars=16)
             qty = st.number_input("Quantity", min_value=1, value=1)
             strike = st.number_input("Strike", value=0.0)
             prem = st.number_input("Premium", value=0.0)
@@ -154,11 +136,10 @@ with st.sidebar:
 
     # Update Cash Balance
     with st.expander("Update Cash Balance"):
-        current_cash = db.get_cash(selected_p)
-        st.write(f"Current: ${current_cash:,.2f}")
+        st.write(f"Current: ${cash:,.2f}")
         
         with st.form("cash_form", clear_on_submit=True):
-            new_cash = st.number_input("New Cash Amount", min_value=0.0, step=100.0, value=float(current_cash))
+            new_cash = st.number_input("New Cash Amount", min_value=0.0, step=100.0, value=float(cash))
             if st.form_submit_button("Update Balance"):
                 db.update_cash(new_cash, selected_p)
                 st.success("Cash Updated!")
@@ -169,7 +150,7 @@ with st.sidebar:
     # --- MANUAL REFRESH BUTTON ---
     if st.button("Refresh Market Data", use_container_width=True):
         with st.status("Fetching latest prices...", expanded=True) as status:
-            st.cache_data.clear()
+            db.clear_portfolio_cache(selected_p)
             st.write("Connecting to Finnhub...")
             utils.update_underlyings(selected_p) # Your existing logic
             st.write("Recalculating Monte Carlo simulations...")
@@ -185,20 +166,23 @@ st.header(f"Portfolio: {selected_p}")
 
 # 1. Top Level Metrics (The Big 5)
 col1, col2, col3, col4, col5, col6 = st.columns(6)
-port_val = db.get_portfolio_val(selected_p)
-trades = db.get_trades(selected_p)
-ers = [t.expected_profit for t in trades if t.trade_type != "shares"]
+# Build the column view from the same snapshot so every row lines up with `trades`
+cols = db.PortfolioArrays.from_trades(trades)
+m = utils.compute_all_metrics(cols, cash)
+port_val = m["port_val"]
+# Keep live prices flowing for these underlyings so the next refresh is a cache read
+api.start_price_stream(set(cols.ticker))
 
 with col1:
     st.metric("Total Value", f"${port_val:,.2f}")
 with col2:
-    st.metric("Gross Exposure", f"${utils.get_gross_exposure(selected_p):,.2f}")
+    st.metric("Gross Exposure", f"${m['gross_exposure']:,.2f}")
 with col3:
-    st.metric("Net Liquidity", f"{utils.get_net_liquidity(selected_p):.2f}")
+    st.metric("Net Liquidity", f"{m['net_liquidity']:.2f}")
 with col4:
-    st.metric("Sortino Ratio", f"{utils.get_sortino_ratio(selected_p):.3f}")
+    st.metric("Sortino Ratio", f"{m['sortino']:.3f}")
 with col5:
-    st.metric("HHI (Conc.)", f"{utils.get_hhi(selected_p):.2f}")
+    st.metric("HHI (Conc.)", f"{m['hhi']:.2f}")
 with col6:
     st.metric("Open Trades:", f"{len(trades)}")
 
@@ -219,35 +203,58 @@ with main_left:
 
     with r_col1:
         st.write("**Exposure & Leverage**")
-        st.info(f"Percent Exposure: {utils.get_percent_exposure(selected_p):.2f}%")
-        st.info(f"Leverage Ratio: {utils.get_leverage_ratio(selected_p):.2f}x")
-        st.info(f"Cash to Pos Ratio: {utils.get_cash_to_pos_ratio(selected_p):.2f}")
-        st.info(f"Highest Pos: {utils.get_highest_pos_percent(selected_p):.2f}%")
+        st.info(f"Percent Exposure: {m['percent_exposure']:.2f}%")
+        st.info(f"Leverage Ratio: {m['leverage']:.2f}x")
+        st.info(f"Cash to Pos Ratio: {m['cash_to_pos']:.2f}")
+        st.info(f"Highest Pos: {m['highest_pos_percent']:.2f}%")
         
         st.write("**Performance Multipliers**")
-        er_ann = utils.get_er_ann(selected_p) * 100
-        er_pct = utils.get_er_percent(ers, selected_p)
+        er_ann = m["er_ann"] * 100
+        er_pct = m["er_percent"]
         st.success(f"LT Alpha: {er_ann / spy_ret_lt:.2f}x")
         st.success(f"ST Alpha: {er_pct / spy_ret_st:.2f}x")
 
     with r_col2:
         st.write("**Returns & Profitability**")
-        st.info(f"Expected Returns: ${utils.get_expected_returns(ers):,.2f}")
+        st.info(f"Expected Returns: ${m['expected_returns']:,.2f}")
         st.info(f"ERP: {er_pct:.2f}%")
         st.info(f"ERPA: {er_ann:.2f}%")
-        st.info(f"Max Gain: ${utils.get_max_profit(selected_p):,.2f}")
+        st.info(f"Max Gain: ${m['max_profit']:,.2f}")
         
         st.write("**Efficiency**")
-        st.info(f"Risk/Reward Ratio: {utils.get_risk_reward_ratio(selected_p):.2f}")
-        st.info(f"Cash Percent: {utils.get_cash_percent(selected_p):.2f}%")
+        st.info(f"Risk/Reward Ratio: {m['risk_reward']:.2f}")
+        st.info(f"Cash Percent: {m['cash_percent']:.2f}%")
+
+# --- Open Trades --- #
+TRADE_ACTIONS = ["", "Edit", "Delete"]
+
+def dispatch_trade_action(p_name, trade_ids, editor_key):
+    # Act on the row whose Action cell changed, then start a fresh editor so it resets
+    for row, changes in st.session_state[editor_key]["edited_rows"].items():
+        action = changes.get("Action")
+        if action == "Edit":
+            st.session_state.editing_trade_id = trade_ids[row]
+            break
+        if action == "Delete":
+            db.delete_trade(trade_ids[row], p_name)
+            st.session_state.trades_changed = True
+            break
+    st.session_state.trades_editor_version += 1
+
+# Fragment reruns reuse these arguments; that's safe because anything that
+# changes a trade (save/delete) triggers a full rerun instead
+@st.fragment
+def render_trades(p_name, trades, cols):
+    # Callbacks can't rerun the app, so a delete flags it for the next fragment pass
+    if st.session_state.pop("trades_changed", False):
+        st.rerun() # Full rerun: the metrics depend on the deleted trade
 
-with main_right:
     st.subheader("Open Trades")
 
     # --- Update Popup Form --- #
     if "editing_trade_id" in st.session_state and st.session_state.editing_trade_id:
         edit_id = st.session_state.editing_trade_id
-        t_to_edit = db.get_trade_by_id(edit_id, selected_p)
+        t_to_edit = next((t for t in trades if t.trade_id == edit_id), None)
         
         if t_to_edit:
             with st.container(border=True):
@@ -269,35 +276,44 @@ with main_right:
                         
                         # Refresh P&L math and Save
                         t_to_edit.refresh_pnl()
-                        db.store_trade(t_to_edit, selected_p)
+                        db.store_trade(t_to_edit, p_name)
                         
                         st.session_state.editing_trade_id = None
                         st.success("Trade Updated!")
-                        st.rerun()
+                        st.rerun() # Full rerun: the metrics depend on the saved trade
                         
                     if c_btn2.form_submit_button("Cancel"):
                         st.session_state.editing_trade_id = None
-                        st.rerun()
+                        st.rerun(scope="fragment")
 
-    # --- Trade Card Layout --- #
+    # --- Trade Table --- #
     if not trades:
         st.info("No open trades.")
     else:
-        # We can make this a scrollable container to mimic your scrollable frame
-        with st.container(height=600): # Set a fixed height for scrolling
-            for t in trades:
-                with st.container(border=True):
-                    c1, c2, c3, c4 = st.columns([2, 1, 1, 1])
-                    c1.markdown(f"**{t.ticker}** ({t.trade_type.upper()})")
-                    c1.caption(f"Exp: {t.expiration.date()}")
-                    c2.metric("Value", f"{t.value:.2f}")
-                    c3.metric("E[P]", f"{t.expected_profit:.2f}")
-                    c4.metric("POP", f"{t.pop*100:.2f}%")
-                    
-                    if st.button("Update Trade", key=f"upd_{t.trade_id}", use_container_width=True):
-                        st.session_state.editing_trade_id = t.trade_id
-                        st.rerun()
-                
-                    if st.button("Delete Trade", type="primary", key=f"del_{t.trade_id}", use_container_width=True):
-                        db.delete_trade(t.trade_id)
-                        st.rerun()
\ No newline at end of file
+        # One editor for every trade; the Action column replaces per-trade buttons
+        trades_df = pd.DataFrame(dict(zip(
+            ["trade_id", "Action", "Ticker", "Type", "Exp", "Value", "E[P]", "POP"],
+            [cols.trade_id, "", cols.ticker, np.char.upper(cols.trade_type),
+             cols.expiration.astype(object), cols.value, cols.expected_profit, cols.pop * 100]
+        )))
+        editor_key = f"trades_editor_{st.session_state.setdefault('trades_editor_version', 0)}"
+        st.data_editor(
+            trades_df,
+            key=editor_key,
+            hide_index=True,
+            height=600, # Set a fixed height for scrolling
+            use_container_width=True,
+            disabled=["Ticker", "Type", "Exp", "Value", "E[P]", "POP"],
+            column_config={
+                "trade_id": None,
+                "Action": st.column_config.SelectboxColumn(options=TRADE_ACTIONS, width="small"),
+                "Value": st.column_config.NumberColumn(format="%.2f"),
+                "E[P]": st.column_config.NumberColumn(format="%.2f"),
+                "POP": st.column_config.NumberColumn(format="%.2f%%"),
+            },
+            on_change=dispatch_trade_action,
+            args=(p_name, list(cols.trade_id), editor_key),
+        )
+
+with main_right:
+    render_trades(selected_p, trades, cols)
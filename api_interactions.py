@@ -2,14 +2,138 @@ import streamlit as st
 import finnhub
 import yfinance as yf
 import numpy as np
+import json
+import threading
+import time
+import uuid
+import websocket
+from concurrent.futures import ThreadPoolExecutor
 
-def get_price(ticker):
+FINNHUB_WS_URL = "wss://ws.finnhub.io"
+PRICE_MAX_AGE = 60.0    # seconds a streamed tick stays fresher than a REST quote / daily close
+OWNER_TTL = 15 * 60.0   # seconds a session's watch list survives without a rerun
+
+class PriceStream:
+    """
+    Background Finnhub websocket that keeps the last traded price of every subscribed ticker.
+    Finnhub only streams trades while the market is open, so readers must handle misses.
+    Sessions register the tickers they watch; the socket follows the union of live sessions.
+    """
+    def __init__(self, api_key):
+        self.prices = {}    # ticker -> (price, monotonic receive time)
+        self.symbols = set()
+        self.owners = {}    # owner id -> (tickers, monotonic last seen)
+        self.lock = threading.Lock()
+        self.ws = websocket.WebSocketApp(
+            f"{FINNHUB_WS_URL}?token={api_key}",
+            on_open=self._on_open,
+            on_message=self._on_message,
+        )
+        threading.Thread(target=self.ws.run_forever, kwargs={"reconnect": 5}, daemon=True).start()
+
+    def watch(self, owner, tickers):
+        """ Replaces owner's watch list, then (un)subscribes so only live sessions' tickers stream """
+        now = time.monotonic()
+        with self.lock:
+            self.owners[owner] = ({t.upper() for t in tickers}, now)
+            # Sessions that stopped rerunning (closed tabs) drop out after OWNER_TTL
+            self.owners = {o: w for o, w in self.owners.items() if now - w[1] <= OWNER_TTL}
+            wanted = set().union(*(w[0] for w in self.owners.values()))
+            new, gone = wanted - self.symbols, self.symbols - wanted
+            self.symbols = wanted
+            for ticker in gone:
+                self.prices.pop(ticker, None)
+        # The socket can drop between any two sends. That's fine: _on_open re-sends the
+        # whole subscription list after the reconnect, so a failed send just stops here
+        try:
+            for ticker in gone:
+                self.ws.send(json.dumps({"type": "unsubscribe", "symbol": ticker}))
+            for ticker in new:
+                self.ws.send(json.dumps({"type": "subscribe", "symbol": ticker}))
+        except (websocket.WebSocketConnectionClosedException, OSError):
+            pass
+
+    def get(self, ticker, max_age=PRICE_MAX_AGE):
+        # Ticks older than max_age (market closed, symbol quiet) count as a miss
+        with self.lock:
+            entry = self.prices.get(ticker.upper())
+        if entry is None or time.monotonic() - entry[1] > max_age:
+            return None
+        return entry[0]
+
+    def _on_open(self, ws):
+        # Also runs after every reconnect, so re-send the whole subscription list
+        with self.lock:
+            symbols = list(self.symbols)
+        for ticker in symbols:
+            ws.send(json.dumps({"type": "subscribe", "symbol": ticker}))
+
+    def _on_message(self, ws, message):
+        msg = json.loads(message)
+        if msg.get("type") != "trade":
+            return  # pings
+        received = time.monotonic()
+        with self.lock:
+            for tick in msg["data"]:
+                if tick["s"] in self.symbols:
+                    self.prices[tick["s"]] = (tick["p"], received)
+
+@st.cache_resource
+def get_price_stream():
+    # One websocket per process, shared across sessions and reruns
+    return PriceStream(st.secrets["FINNHUB_API_KEY"])
+
+def start_price_stream(tickers):
+    """
+    Points this session's share of the shared websocket at tickers so refreshes can read
+    cached prices. Tickers this session watched before and no session still needs are
+    unsubscribed, which keeps the connection under Finnhub's symbol cap.
+    :param tickers: Iterable of stock tickers for the active portfolio
+    """
+    owner = st.session_state.setdefault("price_stream_owner", str(uuid.uuid4()))
+    get_price_stream().watch(owner, tickers)
+
+@st.cache_resource
+def get_finnhub_client():
     # Access key from .streamlit/secrets.toml
+    # One client per process keeps its HTTP session (and TLS connection) warm
     api_key = st.secrets["FINNHUB_API_KEY"]
-    client = finnhub.Client(api_key=api_key)
-    quote = client.quote(ticker.upper())
+    return finnhub.Client(api_key=api_key)
+
+def get_price(ticker):
+    # Prefer the streamed price, fall back to a REST quote (e.g. outside market hours)
+    price = get_price_stream().get(ticker)
+    if price is not None:
+        return price
+    quote = get_finnhub_client().quote(ticker.upper())
     return quote['c']
 
+def get_prices(tickers, max_workers=16):
+    """
+    Fetches prices for several tickers, reading the price stream first and
+    quoting only the misses concurrently over the shared client.
+    :param tickers: Iterable of stock tickers, duplicates are only quoted once
+    :param max_workers: Upper bound on concurrent requests
+    :return: dict of ticker -> current price
+    """
+    stream = get_price_stream()
+    prices = {}
+    missing = []
+    for ticker in dict.fromkeys(t.upper() for t in tickers):
+        price = stream.get(ticker)
+        if price is None:
+            missing.append(ticker)
+        else:
+            prices[ticker] = price
+    if not missing:
+        return prices
+
+    client = get_finnhub_client()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+        quotes = executor.map(client.quote, missing)
+        prices.update({ticker: quote['c'] for ticker, quote in zip(missing, quotes)})
+    return prices
+
 def get_historical_volatility(ticker_symbol, window=30):
     """
     Fetches historical data via yfinance and calculates annualized volatility.
@@ -17,25 +141,79 @@ def get_historical_volatility(ticker_symbol, window=30):
     :param window: Number of days to look back (default 30)
     :return: Annualized volatility as a decimal (e.g., 0.25 for 25%)
     """
+    return get_historical_volatilities([ticker_symbol], window)[ticker_symbol.upper()]
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def get_historical_volatilities(tickers, window=30):
+    """
+    Batch version of get_historical_volatility: one yfinance download for all tickers.
+    :param tickers: List of stock tickers
+    :param window: Number of days to look back (default 30)
+    :return: dict of ticker -> annualized volatility, 0.30 wherever data is missing
+    """
+    tickers = sorted({t.upper() for t in tickers})
     try:
-        # 1. Download data (we fetch slightly more to ensure we have 'window' daily returns)
-        data = yf.download(ticker_symbol, period="60d", interval="1d", progress=False)
-        
-        if data.empty or len(data) < window:
-            return 0.30  # Default fallback (30% is a safe market average)
-
-        # 2. Calculate Daily Log Returns
-        # Formula: ln(Price_t / Price_t-1)
-        close_prices = data['Close'].tail(window + 1)
-        log_returns = np.log(close_prices / close_prices.shift(1)).dropna()
-
-        # 3. Calculate Standard Deviation and Annualize
-        # 252 is the standard number of trading days in a year
-        daily_std = log_returns.std()
-        annualized_vol = daily_std * np.sqrt(252)
-
-        return float(annualized_vol.iloc[0])
-    
+        return _annualized_vols(_download_closes(tickers), tickers, window)
     except Exception as e:
-        print(f"Error fetching vol for {ticker_symbol}: {e}")
-        return 0.30
\ No newline at end of file
+        print(f"Error fetching vol for {tickers}: {e}")
+        return dict.fromkeys(tickers, 0.30)
+
+def get_market_data(tickers, window=30):
+    """
+    Prices and annualized volatilities for every ticker off a single yfinance download.
+    Streamed prices win over the daily close; tickers the download missed are quoted via Finnhub.
+    :param tickers: Iterable of stock tickers
+    :param window: Number of days to look back for volatility (default 30)
+    :return: (dict of ticker -> price, dict of ticker -> volatility)
+    """
+    tickers = sorted({t.upper() for t in tickers})
+    prices = {}
+    vols = dict.fromkeys(tickers, 0.30)
+    try:
+        close_frame = _download_closes(tickers)
+        vols = _annualized_vols(close_frame, tickers, window)
+        if close_frame is not None:
+            latest = close_frame.ffill().iloc[-1]
+            prices = {ticker: float(p) for ticker, p in latest.items() if np.isfinite(p)}
+    except Exception as e:
+        print(f"Error fetching market data for {tickers}: {e}")
+
+    stream = get_price_stream()
+    for ticker in tickers:
+        streamed = stream.get(ticker)
+        if streamed is not None:
+            prices[ticker] = streamed
+
+    missing = [ticker for ticker in tickers if ticker not in prices]
+    if missing:
+        prices.update(get_prices(missing))
+    return prices, vols
+
+def _download_closes(tickers):
+    """ Daily closes for every ticker from one yfinance call (one column per ticker), or None """
+    if not tickers:
+        return None
+    # We fetch slightly more than 'window' days to ensure we have 'window' daily returns
+    data = yf.download(tickers, period="60d", interval="1d", threads=True, progress=False)
+    return None if data.empty else data['Close']
+
+def _annualized_vols(close_frame, tickers, window):
+    vols = dict.fromkeys(tickers, 0.30)  # Default fallback (30% is a safe market average)
+    if close_frame is None:
+        return vols
+
+    # 1. Calculate Daily Log Returns for every ticker column at once
+    # Formula: ln(Price_t) - ln(Price_t-1), straight on the NumPy buffer
+    closes = close_frame.to_numpy(dtype=np.float64)
+    log_returns = np.diff(np.log(closes), axis=0)[-window:]
+
+    # 2. Calculate Standard Deviation and Annualize
+    # 252 is the standard number of trading days in a year
+    annualized_vol = np.nanstd(log_returns, axis=0, ddof=1) * np.sqrt(252)
+
+    # Tickers without a full window keep the fallback
+    enough_data = np.count_nonzero(~np.isnan(closes), axis=0) >= window
+    for ticker, vol, ok in zip(close_frame.columns, annualized_vol, enough_data):
+        if ok and np.isfinite(vol):
+            vols[ticker] = float(vol)
+    return vols
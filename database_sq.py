@@ -1,13 +1,80 @@
 import pickle
-from supabase import create_client
+import base64
+from dataclasses import dataclass
+from supabase import create_client, ClientOptions
+import httpx
 import streamlit as st
+import numpy as np
+import pandas as pd
+from trade import Trade
+
+CREDIT_TRADES = ("csp", "cc", "short_put", "short_call")
+# Marks base64-encoded trade data; legacy rows are hex and can never contain ':'
+B64_PREFIX = "b64:"
+PICKLE_PROTO = b"\x80"
+
+@dataclass
+class PortfolioArrays:
+    """ Structure-of-arrays view of a portfolio's trades; index i is the same trade in every field """
+    trade_id: np.ndarray
+    ticker: np.ndarray
+    ticker_codes: np.ndarray    # dense per-ticker index (first-seen order) for np.bincount
+    trade_type: np.ndarray
+    expiration: np.ndarray
+    qty: np.ndarray
+    value: np.ndarray
+    expected_profit: np.ndarray
+    pop: np.ndarray
+    max_loss: np.ndarray
+    max_gain: np.ndarray
+    pos_len: np.ndarray
+    downside_sq: np.ndarray
+    has_dist: np.ndarray
+
+    @classmethod
+    def from_trades(cls, trades):
+        n = len(trades)
+        ticker = np.array([t.ticker for t in trades], dtype=str)
+        # Hash-based, so no sort of the ticker strings like np.unique
+        ticker_codes, _ = pd.factorize(ticker)
+        return cls(
+            trade_id=np.array([t.trade_id for t in trades], dtype=str),
+            ticker=ticker,
+            ticker_codes=ticker_codes,
+            trade_type=np.array([t.trade_type for t in trades], dtype=str),
+            expiration=np.array([t.expiration for t in trades], dtype="datetime64[D]"),
+            qty=np.fromiter((t.qty for t in trades), dtype=np.int64, count=n),
+            value=np.fromiter((t.value for t in trades), dtype=np.float64, count=n),
+            expected_profit=np.fromiter((t.expected_profit for t in trades), dtype=np.float64, count=n),
+            pop=np.fromiter((t.pop for t in trades), dtype=np.float64, count=n),
+            max_loss=np.fromiter((t.max_loss for t in trades), dtype=np.float64, count=n),
+            max_gain=np.fromiter((t.max_gain for t in trades), dtype=np.float64, count=n),
+            pos_len=np.fromiter((t.pos_len for t in trades), dtype=np.float64, count=n),
+            downside_sq=np.fromiter((t.downside_sq_mean for t in trades), dtype=np.float64, count=n),
+            has_dist=np.fromiter((t.pnl_dist is not None for t in trades), dtype=bool, count=n),
+        )
+
+    def __len__(self):
+        return len(self.trade_id)
+
+    def port_val(self, cash):
+        # Credit trades are liabilities, so only debit positions add value
+        return cash + float(self.value[~np.isin(self.trade_type, CREDIT_TRADES)].sum())
 
 # Initialize Supabase client
 @st.cache_resource
 def get_supabase():
     url = st.secrets["SUPABASE_URL"]
     key = st.secrets["SUPABASE_KEY"]
-    return create_client(url, key)
+    # One pooled HTTP/2 client for every query. httpx drops idle connections
+    # after 5s by default, which meant a fresh TLS handshake on most clicks.
+    http_client = httpx.Client(
+        http2=True,
+        timeout=10.0,
+        follow_redirects=True,
+        limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=60.0),
+    )
+    return create_client(url, key, options=ClientOptions(httpx_client=http_client))
 
 supabase = get_supabase()
 
@@ -25,10 +92,13 @@ def init_db():
         portfolio_name TEXT REFERENCES portfolios(name) ON DELETE CASCADE,
         data TEXT
     );
+
+    -- Every trade read/delete filters by portfolio, so avoid a seq scan per render
+    CREATE INDEX IF NOT EXISTS idx_trades_portfolio ON trades(portfolio_name);
     """
     pass # Table creation is handled via Supabase Dashboard UI
 
-@st.cache_data(ttl=600)
+@st.cache_data(ttl=600, show_spinner=False)
 def get_portfolios():
     response = supabase.table("portfolios").select("name").execute()
     return [row['name'] for row in response.data]
@@ -42,89 +112,112 @@ def build_portfolio(name):
     if hasattr(response, 'error') and response.error:
         raise ValueError(f"Could not create portfolio: {response.error.message}")
     
-    st.cache_data.clear()
+    get_portfolios.clear()
 
 def delete_portfolio(p_name):
-    # Foreign Key Cascade should handle trades if set up in SQL Editor,
-    # but we will be explicit to match your old logic.
-    supabase.table("trades").delete().eq("portfolio_name", p_name).execute()
+    # trades.portfolio_name is ON DELETE CASCADE (see init_db), so one delete
+    # removes the portfolio and its trades in a single round-trip
     supabase.table("portfolios").delete().eq("name", p_name).execute()
-    st.cache_data.clear()
-
-@st.cache_data(ttl=600)
-def get_cash(p_name):
-    response = supabase.table("portfolios").select("cash").eq("name", p_name).execute()
-    if response.data:
-        return float(response.data[0]['cash'])
-    return 0.0
+    get_portfolios.clear()
+    clear_portfolio_cache(p_name)
 
 def update_cash(val, p_name):
     supabase.table("portfolios").update({"cash": float(val)}).eq("name", p_name).execute()
-    st.cache_data.clear()
+    get_portfolio_snapshot.clear(p_name)
 
 def store_trade(trade, p_name):
-    # 1. Convert object to bytes, then to a clean hex string
-    trade_data_hex = pickle.dumps(trade).hex()
-    
-    payload = {
+    store_trades([trade], p_name)
+
+def store_trades(trades, p_name):
+    # Every row goes up in one bulk upsert rather than a request per trade
+    if not trades:
+        return
+    payload = [_trade_row(trade, p_name) for trade in trades]
+    supabase.table("trades").upsert(payload).execute()
+    get_trades.clear(p_name)
+    get_portfolio_snapshot.clear(p_name)
+
+def _trade_row(trade, p_name):
+    # 1. Pack the trade into its fixed binary layout, then base64 it
+    # (4/3 the raw size on the wire, where hex was 2x)
+    trade_data_b64 = B64_PREFIX + base64.b64encode(trade.to_bytes()).decode()
+
+    return {
         "trade_id": trade.trade_id,
         "portfolio_name": p_name,
-        "data": trade_data_hex  # This is now a plain string
+        "data": trade_data_b64  # This is now a plain string
     }
-    supabase.table("trades").upsert(payload).execute()
-    st.cache_data.clear()
-
-def get_trade_by_id(trade_id, p_name):
-    response = supabase.table("trades").select("data").eq("trade_id", trade_id).eq("portfolio_name", p_name).execute()
-    if response.data:
-        hex_data = response.data[0]['data']
-        try:
-            if isinstance(hex_data, str):
-                if hex_data.startswith('\\x'):
-                    hex_data = hex_data[2:]
-                return pickle.loads(bytes.fromhex(hex_data))
-            else:
-                return pickle.loads(bytes(hex_data))
-        except Exception as e:
-            print(f"Error unpickling specific trade: {e}")
-    return None
-
-@st.cache_data(ttl=600)
+
+@st.cache_data(ttl=600, show_spinner=False)
 def get_trades(p_name):
     response = supabase.table("trades").select("data").eq("portfolio_name", p_name).execute()
-    
-    trades_list = []
-    for row in response.data:
-        hex_data = row['data']
-        
-        try:
-            # Since we changed the column to TEXT, Supabase returns a clean string.
-            # We just need to strip any Postgres prefix if it exists.
-            if isinstance(hex_data, str):
-                if hex_data.startswith('\\x'):
-                    hex_data = hex_data[2:]
-                
-                # Convert hex string back to bytes
-                actual_binary = bytes.fromhex(hex_data)
-                
-                # Unpickle
-                trades_list.append(pickle.loads(actual_binary))
-        except Exception as e:
-            print(f"Error decoding trade row: {e}")
-            continue
-            
-    return trades_list
-
-def delete_trade(trade_id):
-    supabase.table("trades").delete().eq("trade_id", trade_id).execute()
-    st.cache_data.clear()
-
-def get_portfolio_val(p_name):
-    cash = get_cash(p_name)
-    trades = get_trades(p_name)
-    credit_trades = {"csp", "cc", "short_put", "short_call"}
-    val = cash
-    for trade in trades:
-        if trade.trade_type not in credit_trades:
-            val += trade.value
-    return val
\ No newline at end of file
+    return _decode_trades(response.data)
+
+@st.cache_data(ttl=600, show_spinner=False)
+def get_portfolio_snapshot(p_name):
+    """
+    Fetches cash and every trade for a portfolio in a single round-trip.
+    PostgREST embeds the trades through the portfolio_name foreign key,
+    so the dashboard can render all of its metrics off one request.
+    :return: (cash, [Trade, ...])
+    """
+    # Embedded rows come back in whatever order Postgres scans them, so pin it
+    response = (
+        supabase.table("portfolios")
+        .select("cash, trades(data)")
+        .eq("name", p_name)
+        .order("trade_id", foreign_table="trades")
+        .execute()
+    )
+    if not response.data:
+        return 0.0, []
+    row = response.data[0]
+    return float(row['cash']), _decode_trades(row['trades'])
+
+def _row_blob(data):
+    if data.startswith(B64_PREFIX):
+        return base64.b64decode(data[len(B64_PREFIX):])
+    # Older rows are hex; strip any Postgres bytea prefix if it exists
+    if data.startswith('\\x'):
+        data = data[2:]
+    return bytes.fromhex(data)
+
+def _decode_trade(data):
+    try:
+        blob = _row_blob(data)
+        # Only rows written before the binary layout are pickles, and those start with the
+        # PROTO opcode; anything else goes through from_bytes, which rejects unknown versions
+        if blob[:1] == PICKLE_PROTO:
+            trade = pickle.loads(blob)
+            trade.cache_pnl_stats()
+            return trade
+        return Trade.from_bytes(blob)
+    except Exception as e:
+        print(f"Error decoding trade row: {e}")
+        return None
+
+def _decode_trades(rows):
+    decoded = [_decode_trade(row['data']) for row in rows]
+    return [t for t in decoded if t is not None]
+
+def migrate_legacy_trades(p_name):
+    """
+    One-off re-store of a portfolio's pickled rows in the binary layout, so the
+    pickle fallback in _decode_trade stops being hit for them.
+    :return: number of rows rewritten
+    """
+    response = supabase.table("trades").select("data").eq("portfolio_name", p_name).execute()
+    legacy = [row for row in response.data if _row_blob(row['data'])[:1] == PICKLE_PROTO]
+    trades = _decode_trades(legacy)
+    store_trades(trades, p_name)
+    return len(trades)
+
+def delete_trade(trade_id, p_name):
+    supabase.table("trades").delete().eq("trade_id", trade_id).eq("portfolio_name", p_name).execute()
+    get_trades.clear(p_name)
+    get_portfolio_snapshot.clear(p_name)
+
+def clear_portfolio_cache(p_name):
+    # Only drop the cached reads for this portfolio so the others stay warm
+    get_trades.clear(p_name)
+    get_portfolio_snapshot.clear(p_name)
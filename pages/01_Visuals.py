@@ -2,7 +2,8 @@ import streamlit as st
 import database_sq as db
 import utils
 import plotly.express as px
-import plotly.figure_factory as ff
+import plotly.graph_objects as go
+from scipy.ndimage import gaussian_filter1d
 import pandas as pd
 import numpy as np
 
@@ -16,7 +17,9 @@ if "active_portfolio" not in st.session_state or not st.session_state.active_por
 selected_p = st.session_state.active_portfolio
 st.title(f"Visual Analysis: {selected_p}")
 
-trades = db.get_trades(selected_p)
+cash, trades = db.get_portfolio_snapshot(selected_p)
+cols = db.PortfolioArrays.from_trades(trades)
+port_val = cols.port_val(cash)
 
 if not trades:
     st.info("No trades found to visualize.")
@@ -32,7 +35,7 @@ else:
             "Type": t.trade_type,
             "Exp": t.expiration,
             "Risk": abs(t.max_loss), # Ensure risk is a positive value for the pie
-            "Portfolio-Risk(%)": utils.get_percent_risk_position(t, selected_p)
+            "Portfolio-Risk(%)": utils.get_percent_risk_position(t, port_val)
         })
     df = pd.DataFrame(data)
 
@@ -79,19 +82,13 @@ else:
 if trades:
     st.subheader("Portfolio Aggregated P&L Distribution")
 
-    # 1. Collect all simulation arrays
-    # Assuming each t.pnl_dist is a numpy array of length 100,000
-    all_sims = [np.array(t.pnl_dist) for t in trades if t.trade_type not in ["shares"]]
+    # 1. Sum the option simulations element-wise into one accumulator
+    # This represents the portfolio's outcome across every simulated scenario
+    portfolio_sims = utils.aggregate_pnl(trades)
 
-    if all_sims:
-        # 2. Sum the simulations element-wise
-        # This represents the portfolio's outcome across 100,000 different scenarios
-        portfolio_sims = np.sum(all_sims, axis=0)
-
-        # 3. Calculate Aggregate Stats
-        avg_pnl = np.mean(portfolio_sims)
-        std_dev = np.std(portfolio_sims)
-        prob_profit = (portfolio_sims > 0).mean() * 100
+    if portfolio_sims is not None:
+        # 2. Calculate Aggregate Stats
+        avg_pnl, std_dev, prob_profit = utils.get_pnl_stats(portfolio_sims)
 
         # Display Summary Stats
         m1, m2, m3 = st.columns(3)
@@ -99,18 +96,15 @@ if trades:
         m2.metric("Portfolio Std Dev", f"${std_dev:,.2f}")
         m3.metric("Portfolio POP", f"{prob_profit:.1f}%")
 
-        # 4. Create the Distribution Plot (Histogram + KDE)
-        # Using a subset of data for faster rendering if sims are very large
-        plot_data = portfolio_sims[::10] # Sample every 10th result for speed
-        
-        fig = ff.create_distplot(
-            [plot_data], 
-            group_labels=["Portfolio Total P&L"], 
-            bin_size=[std_dev/10],
-            show_hist=True,
-            show_curve=True,
-            colors=['#0971B2']
-        )
+        # 3. Create the Distribution Plot (Histogram + smoothed curve)
+        # Binning every sim is O(n), so no subsampling; smoothing the bins stands in for a KDE
+        density, edges = np.histogram(portfolio_sims, bins=80, density=True)
+        centers = 0.5 * (edges[:-1] + edges[1:])
+
+        fig = go.Figure([
+            go.Bar(x=centers, y=density, width=edges[1] - edges[0], marker_color='#0971B2', opacity=0.7),
+            go.Scatter(x=centers, y=gaussian_filter1d(density, 2), mode="lines", line_color='#0971B2'),
+        ])
         
         fig.update_layout(
             title_text="Monte Carlo Portfolio Simulation",
@@ -127,10 +121,10 @@ if trades:
     else:
         st.warning("No simulation data found. Try refreshing market data on the Dashboard.")
 
-def render_compounding_chart(trades, port_val):
+def render_compounding_chart(cols, port_val):
     st.subheader("10-Year Wealth Forecast")
     
-    annual_rate = utils.get_er_ann(selected_p)
+    annual_rate = utils.get_er_ann(cols, port_val)
     if not annual_rate or port_val <= 0:
         st.info("Add risk-defined trades to generate a forecast.")
         return
@@ -172,4 +166,4 @@ def render_compounding_chart(trades, port_val):
                f"Conservative assumes a realization of {conservative_rate*100:.1f}% APR.")
 
 if trades:
-    render_compounding_chart(trades, db.get_portfolio_val(selected_p))
\ No newline at end of file
+    render_compounding_chart(cols, port_val)
\ No newline at end of file
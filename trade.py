@@ -1,8 +1,118 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import uuid
-from math import sqrt
+import struct
+from math import sqrt, exp, log
 import api_interactions as api
 import numpy as np
+import blosc2
+from scipy.special import ndtr, ndtri
+from numba import njit, prange
+
+TRADE_TYPES = ("shares", "csp", "cc", "short_call", "short_put", "long_call", "long_put")
+
+# Fixed binary layout used to persist a Trade:
+# version, trade_id, type code, ticker, qty, strike, premium, underlying, iv,
+# expiration/opened (microseconds since epoch), pnl_dist itemsize and length.
+# The pnl_dist buffer follows the header: raw in version 1, a blosc2 chunk from version 2.
+TRADE_FMT = struct.Struct("<B16sB16siddddqqBI")
+TRADE_FMT_VERSION = 2
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+
+# PCG64 generator shared by every simulation (vectorized, float32-capable, no global state)
+_RNG = np.random.default_rng()
+# Paths per refresh; "high" keeps the original 100k
+SIMS = {"normal": 2**14, "high": 100000}
+
+@njit(fastmath=True, cache=True)
+def _payoff(type_code, ST, S0, K, qty, premium):
+    """ Terminal P&L of one trade for one terminal price; type_code indexes TRADE_TYPES """
+    lots = 100 * qty
+    credit = premium * lots    # credit = +, debit = -
+    if type_code == 0:  # shares
+        return (ST - S0) * qty
+    if type_code == 1 or type_code == 4:  # csp, short_put
+        return credit - max(K - ST, 0.0) * lots
+    if type_code == 2:  # cc: long stock + short call
+        return (ST - S0) * qty + credit - max(ST - K, 0.0) * lots
+    if type_code == 3:  # short_call
+        return credit - max(ST - K, 0.0) * lots
+    if type_code == 5:  # long_call
+        return max(ST - K, 0.0) * lots - credit
+    return max(K - ST, 0.0) * lots - credit  # long_put
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _simulate_payoff(type_code, S0, K, iv, T, qty, premium, mu, Z, out):
+    """
+    Fused GBM + payoff kernel. Turns each normal draw in Z into an antithetic
+    pair of terminal prices and writes their P&L straight into out, so no
+    price array is stored. out must hold 2 * len(Z) values.
+    """
+    half = Z.shape[0]
+    drift = (mu - 0.5 * iv**2) * T
+    vol = iv * np.sqrt(T)
+    for i in prange(half):
+        z = Z[i]
+        out[i] = _payoff(type_code, S0 * np.exp(drift + vol * z), S0, K, qty, premium)
+        out[i + half] = _payoff(type_code, S0 * np.exp(drift - vol * z), S0, K, qty, premium)
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _simulate_payoff_batch(type_code, S0, K, iv, T, qty, premium, mu, Z, out):
+    """
+    _simulate_payoff for N trades at once. Every parameter except mu and Z is a
+    length-N array; row n of Z (shape N x half) holds trade n's own draws and
+    row n of out (shape N x 2 * half) receives trade n's P&L.
+    """
+    half = Z.shape[1]
+    n_trades = type_code.shape[0]
+    drift = (mu - 0.5 * iv**2) * T
+    vol = iv * np.sqrt(T)
+    for i in prange(half):
+        for n in range(n_trades):
+            z = Z[n, i]
+            out[n, i] = _payoff(type_code[n], S0[n] * np.exp(drift[n] + vol[n] * z), S0[n], K[n], qty[n], premium[n])
+            out[n, i + half] = _payoff(type_code[n], S0[n] * np.exp(drift[n] - vol[n] * z), S0[n], K[n], qty[n], premium[n])
+
+def draw_normals(sims, out=None):
+    """
+    half = sims // 2 float32 standard normals; antithetic pairs are formed in the kernels.
+    Stratified: one uniform in each of the half equal slices of (0, 1), mapped through ndtri.
+    That is the same point set a scrambled 1-D Sobol sequence gives, but the slices come in
+    a fresh random order per call, so two trades' draws at the same index are independent
+    and summing trades path by path in aggregate_pnl stays valid.
+    Fills out in place when given (e.g. one row of a batch's draw matrix).
+    """
+    half = sims // 2
+    Z = np.empty(half, dtype=np.float32) if out is None else out
+    u = _RNG.permutation(half) + _RNG.random(half)
+    u /= half
+    ndtri(u, out=Z)
+    return Z
+
+def refresh_pnl_batch(positions, precision="normal", mu=0.0):
+    """
+    Re-simulates pnl_dist for every position in one kernel call.
+    Each trade gets its own draws, so the batch matches refresh_pnl exactly:
+    underlyings stay independent in aggregate_pnl whichever path refreshed them.
+    Shares use their closed-form stats and are not simulated.
+    """
+    for pos in positions:
+        if pos.trade_type == "shares":
+            pos.refresh_pnl(precision)
+    positions = [pos for pos in positions if pos.trade_type != "shares"]
+    if not positions:
+        return
+    type_code, S0, K, iv, T, qty, premium = (np.array(col) for col in zip(*(pos.sim_params() for pos in positions)))
+    half = SIMS[precision] // 2
+    Z = np.empty((len(positions), half), dtype=np.float32)
+    for row in Z:
+        draw_normals(SIMS[precision], out=row)
+    out = np.empty((len(positions), 2 * half), dtype=np.float32)
+    _simulate_payoff_batch(type_code, S0, K, iv, T, qty, premium, float(mu), Z, out)
+
+    for pos, pnl in zip(positions, out):
+        pos.pnl_dist = pnl
+        pos.cache_pnl_stats()
 
 class Trade:
     def __init__(
@@ -26,7 +136,7 @@ class Trade:
         self.underlying_price = underlying_price if underlying_price else api.get_price(self.ticker)
         self.iv = iv if self.trade_type != "shares" else api.get_historical_volatility(self.ticker)
         self.opened = datetime.now()
-        self.pnl_dist = self.simulate_payoff(100000, 0.0)
+        self.refresh_pnl()
 
     # ------------------------
     # Computed risk properties
@@ -53,9 +163,9 @@ class Trade:
 
     # -------------------------------------
     # Max Gain / Max Loss by strategy type
+    # (stored as plain floats by cache_pnl_stats)
     # -------------------------------------
-    @property
-    def max_gain(self):
+    def _compute_max_gain(self):
         t = self.trade_type
 
         if t == "shares":
@@ -81,8 +191,7 @@ class Trade:
 
         return 0
 
-    @property
-    def max_loss(self):
+    def _compute_max_loss(self):
         t = self.trade_type
 
         if t == "shares":
@@ -113,81 +222,120 @@ class Trade:
     # ---------------------------
     # Refresher for pnl_dist
     # ---------------------------
-    def refresh_pnl(self):
-        # Refresh pnl distribution field
-        self.pnl_dist = self.simulate_payoff(100000, 0.0)
+    def refresh_pnl(self, precision="normal"):
+        # Refresh pnl distribution field and the stats derived from it
+        # Shares have a closed-form lognormal P&L, so they skip the simulation
+        self.pnl_dist = None if self.trade_type == "shares" else self.simulate_payoff(SIMS[precision], 0.0)
+        self.cache_pnl_stats()
 
+    def cache_pnl_stats(self):
+        """
+        Reduces pnl_dist once so the stat properties don't rescan every sim per access.
+        Also fixes max_gain / max_loss as floats for the current price, qty and strike.
+        """
+        self.max_gain = float(self._compute_max_gain())
+        self.max_loss = float(self._compute_max_loss())
+        if self.trade_type == "shares":
+            self._cache_share_stats()
+            return
+        pnl = self.pnl_dist
+        if pnl is None:
+            self._expected_profit = self._pop = self._std = self._downside_sq_mean = 0.0
+            return
+        # Reduce in float64 so the float32 samples don't lose precision in the sums
+        self._expected_profit = float(pnl.mean(dtype=np.float64))
+        self._pop = float(np.count_nonzero(pnl > 0) / pnl.size)
+        self._std = float(pnl.std(dtype=np.float64))
+        self._downside_sq_mean = self.downside_sq(0.0)
+
+    def _cache_share_stats(self, mu=0.0):
+        """
+        Exact stats of the 1 year share P&L qty * S0 * (e^Y - 1), Y ~ N((mu - iv^2/2), iv^2),
+        i.e. what simulate_payoff would converge to for a shares trade
+        """
+        a = self.qty * self.underlying_price
+        s = self.iv
+        m = mu - 0.5 * s**2
+        if s <= 0 or a == 0:
+            pnl = a * (exp(m) - 1)
+            self._expected_profit = pnl
+            self._pop = float(pnl > 0)
+            self._std = 0.0
+            self._downside_sq_mean = self._share_downside_sq(0.0, mu)
+            return
+
+        second = exp(2 * m + 2 * s**2) - 2 * exp(m + 0.5 * s**2) + 1    # E[(e^Y - 1)^2]
+        mean = exp(mu) - 1
+
+        self._expected_profit = float(a * mean)
+        self._pop = float(ndtr(m / s) if a > 0 else ndtr(-m / s))
+        self._std = float(abs(a) * sqrt(max(second - mean**2, 0.0)))
+        self._downside_sq_mean = self._share_downside_sq(0.0, mu)
+
+    def _share_downside_sq(self, target=0.0, mu=0.0):
+        """
+        Exact E[min(P&L - target, 0)^2] for the share P&L a * (e^Y - 1).
+        The shortfall a * e^Y - b (b = a + target) only changes sign at y0 = ln(b / a),
+        so the square splits into E[e^(kY)] terms over one side of y0, for k = 0, 1, 2.
+        """
+        a = self.qty * self.underlying_price
+        s = self.iv
+        m = mu - 0.5 * s**2
+        b = a + target
+        if s <= 0 or a == 0:
+            return min(a * exp(m) - b, 0.0) ** 2
+
+        if b / a <= 0:
+            # No crossing: long shares never fall below the target, short shares always do
+            if a > 0:
+                return 0.0
+            w = [exp(k * m + 0.5 * (k * s) ** 2) for k in range(3)]
+        else:
+            # E[e^(kY); Y < y0] for long shares, E[e^(kY); Y > y0] for short shares
+            y0 = log(b / a)
+            side = 1.0 if a > 0 else -1.0
+            w = [exp(k * m + 0.5 * (k * s) ** 2) * ndtr(side * (y0 - m - k * s**2) / s) for k in range(3)]
+        return float(max(a**2 * w[2] - 2 * a * b * w[1] + b**2 * w[0], 0.0))
 
     # ---------------------------
     # Monte Carlo and POP Helpers
     # ---------------------------
-    def simulate_payoff(self, sims=100000, mu=0.0):
+    def sim_params(self):
+        """ Kernel arguments (type_code, S0, K, iv, T, qty, premium) for this trade """
+        t = self.trade_type.lower()
+        if t not in TRADE_TYPES:
+            raise ValueError(f"Unsupported trade type: {self.trade_type}")
+
+        if t == "shares":
+            # One year horizon; shares have no strike or premium in the payoff
+            return (TRADE_TYPES.index(t), float(self.underlying_price), 0.0, float(self.iv), 1.0, float(self.qty), 0.0)
+
+        if self.strike is None or self.premium is None:
+            raise ValueError(f"{self.trade_type} trade needs a strike and a premium")
+        T = max(self.dte, 0) / 365.0
+        return (
+            TRADE_TYPES.index(t),
+            float(self.underlying_price),
+            float(self.strike),
+            float(self.iv),
+            float(T),
+            float(self.qty),
+            float(self.premium),    # credit = +, debit = -
+        )
+
+    def simulate_payoff(self, sims=SIMS["normal"], mu=0.0):
         """
         Monte Carlo payoff simulator for all Trade types.
         Returns simulated terminal P&L array.
         """
+        params = self.sim_params()
 
-        # extract params from trade object
-        S0 = self.underlying_price
-        K = self.strike
-        iv = self.iv
-        T = 0
-        if self.trade_type == "shares":
-            T = 1
-        else:
-            T = max(self.dte, 0) / 365.0 
-        qty = self.qty
-        premium = self.premium    # credit = +, debit = -
-
-        # Generate terminal prices under GBM
+        # Generate terminal prices under GBM and apply the payoff in one pass
         # Antithetic variates for variance reduction
-        half = sims // 2
-        Z = np.random.normal(size=half)
-        Z_full = np.concatenate([Z, -Z])
-
-        ST = S0 * np.exp((mu - 0.5 * iv**2) * T + iv * np.sqrt(T) * Z_full)
-
-        # ================================
-        # PAYOFF LOGIC BY TRADE TYPE
-        # ================================
-        payoff = np.zeros_like(ST)
-
-        t = self.trade_type.lower()
-
-        # ----- Long Call -----
-        if t == "long_call":
-            payoff = np.maximum(ST - K, 0) * 100 * qty - premium * 100 * qty
-
-        # ----- Long Put -----
-        elif t == "long_put":
-            payoff = np.maximum(K - ST, 0) * 100 * qty - premium * 100 * qty
-
-        # ----- Short Call -----
-        elif t == "short_call":
-            payoff = -np.maximum(ST - K, 0) * 100 * qty + premium * 100 * qty
-
-        # ----- Short Put -----
-        elif t == "short_put":
-            payoff = -np.maximum(K - ST, 0) * 100 * qty + premium * 100 * qty
-
-        # ----- Covered Call -----
-        elif t == "cc":
-            # long stock + short call
-            stock_pnl = (ST - S0) * qty
-            call_pnl = -np.maximum(ST - K, 0) * 100 * qty + premium * 100 * qty
-            payoff = stock_pnl + call_pnl
-
-        # ----- Cash Secured Put -----
-        elif t == "csp":
-            payoff = -np.maximum(K - ST, 0) * 100 * qty + premium * 100 * qty
-
-        # ----- Shares Only -----
-        elif t == "shares":
-            payoff = (ST - S0) * qty
-
-        else:
-            raise ValueError(f"Unsupported trade type: {self.trade_type}")
-
+        # float32 halves memory/bandwidth; dollars don't need 15 significant digits
+        Z = draw_normals(sims)
+        payoff = np.empty(2 * Z.shape[0], dtype=np.float32)
+        _simulate_payoff(*params, float(mu), Z, payoff)
         return payoff
 
 
@@ -197,20 +345,91 @@ class Trade:
     @property
     def pop(self):
         """ Empirical Probability of Profit using Monte Carlo """
-        pnl = self.pnl_dist
-        if pnl is None:
-            return 0.0
-        return float(np.mean(pnl > 0))
+        return self._pop
 
 
     @property
     def expected_profit(self):
         """ Expected terminal P&L (mean of payoff distribution) """
-        pnl = self.pnl_dist
-        if pnl is None:
+        return self._expected_profit
+
+    @property
+    def pnl_std(self):
+        """ Standard deviation of the terminal P&L distribution """
+        return self._std
+
+    @property
+    def downside_sq_mean(self):
+        """ Mean squared shortfall below a 0 target (Sortino downside term) """
+        return self._downside_sq_mean
+
+    def downside_sq(self, target=0.0):
+        """ Mean squared shortfall below target; exact for shares, over pnl_dist otherwise """
+        if self.trade_type == "shares":
+            return self._share_downside_sq(target)
+        if self.pnl_dist is None:
             return 0.0
-        return float(np.mean(pnl))
+        shortfall = np.minimum(self.pnl_dist - np.float32(target), 0.0)
+        return float(np.mean(np.square(shortfall, out=shortfall), dtype=np.float64))
     
+    # ---------------------------
+    # Binary serialization
+    # ---------------------------
+    def to_bytes(self):
+        """ Packs the trade into TRADE_FMT followed by the compressed pnl_dist buffer """
+        pnl = self.pnl_dist
+        # Byte-shuffled zstd roughly halves a float32 P&L distribution (capped payoffs repeat a lot)
+        dist = b"" if pnl is None else blosc2.compress(
+            np.ascontiguousarray(pnl), typesize=pnl.itemsize, clevel=1,
+            filter=blosc2.Filter.SHUFFLE, codec=blosc2.Codec.ZSTD
+        )
+        ticker = self.ticker.encode()
+        # The 16s field would silently truncate a longer ticker
+        if len(ticker) > 16:
+            raise ValueError(f"Ticker too long to store: {self.ticker}")
+        header = TRADE_FMT.pack(
+            TRADE_FMT_VERSION,
+            uuid.UUID(self.trade_id).bytes,
+            TRADE_TYPES.index(self.trade_type),
+            ticker,
+            int(self.qty),
+            np.nan if self.strike is None else self.strike,
+            np.nan if self.premium is None else self.premium,
+            self.underlying_price,
+            self.iv,
+            (self.expiration - _EPOCH) // _US,
+            (self.opened - _EPOCH) // _US,
+            0 if pnl is None else pnl.itemsize,
+            0 if pnl is None else len(pnl),
+        )
+        return header + dist
+
+    @classmethod
+    def from_bytes(cls, blob):
+        """ Rebuilds a Trade from to_bytes output without re-running __init__ """
+        (version, trade_id, type_code, ticker, qty, strike, premium, underlying_price, iv,
+         expiration_us, opened_us, itemsize, n) = TRADE_FMT.unpack_from(blob)
+        if not 1 <= version <= TRADE_FMT_VERSION:
+            raise ValueError(f"Unknown trade format version: {version}")
+
+        trade = cls.__new__(cls)
+        trade.trade_id = str(uuid.UUID(bytes=trade_id))
+        trade.trade_type = TRADE_TYPES[type_code]
+        trade.ticker = ticker.rstrip(b"\0").decode()
+        trade.qty = qty
+        trade.strike = None if np.isnan(strike) else strike
+        trade.premium = None if np.isnan(premium) else premium
+        trade.underlying_price = underlying_price
+        trade.iv = iv
+        trade.expiration = _EPOCH + expiration_us * _US
+        trade.opened = _EPOCH + opened_us * _US
+        dist = blob[TRADE_FMT.size:]
+        if itemsize and version > 1:
+            dist = blosc2.decompress(dist)
+        trade.pnl_dist = None if not itemsize else np.frombuffer(dist, dtype=f"<f{itemsize}", count=n)
+        trade.cache_pnl_stats()
+        return trade
+
     # To String
     def __str__(self):
         return f"{self.ticker}, value: {self.value:.2f}"
\ No newline at end of file
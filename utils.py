@@ -1,217 +1,204 @@
-from trade import Trade
+from trade import Trade, refresh_pnl_batch
 import database_sq as database 
 import api_interactions as api
 import yfinance as yf
 import numpy as np
 
+# All Dashboard Metrics
+def compute_all_metrics(cols, cash) -> dict:
+    """
+    Computes every dashboard metric off the columnar trade view, sharing one port_val.
+    :param cols: PortfolioArrays built from the portfolio snapshot
+    :param cash: Portfolio cash balance
+    :return: dict of metric name -> float
+    """
+    port_val = cols.port_val(cash)
+    ers = cols.expected_profit[cols.trade_type != "shares"]
+
+    return {
+        "port_val": port_val,
+        "gross_exposure": get_gross_exposure(cols),
+        "net_liquidity": get_net_liquidity(cols, cash),
+        "sortino": get_sortino_ratio(cols, port_val),
+        "hhi": get_hhi(cols),
+        "percent_exposure": get_percent_exposure(cols, port_val),
+        "leverage": get_leverage_ratio(cols, port_val),
+        "cash_to_pos": get_cash_to_pos_ratio(cols, cash),
+        "highest_pos_percent": get_highest_pos_percent(cols, port_val),
+        "er_ann": get_er_ann(cols, port_val),
+        "er_percent": get_er_percent(ers, port_val),
+        "expected_returns": get_expected_returns(ers),
+        "max_profit": get_max_profit(cols),
+        "risk_reward": get_risk_reward_ratio(cols),
+        "cash_percent": get_cash_percent(cash, port_val),
+    }
+
 # Risk Section Metrics
-def get_percent_exposure(p_name) -> float:
-    exp = get_gross_exposure(p_name)
-    val = database.get_portfolio_val(p_name)
-    return (exp / val) * 100 if val > 0 else 0.0
-
-def get_gross_exposure(p_name) -> float:
-    trades = database.get_trades(p_name)
-    cumm_exposure = 0.0
-    for trade in trades:
-        cumm_exposure += trade.max_loss
-    return cumm_exposure
-
-def get_cash_percent(p_name) -> float:
-    cash = database.get_cash(p_name)
-    total_val = database.get_portfolio_val(p_name)
-    return (cash / total_val * 100) if total_val > 0 else 0.0
-
-def get_cash_to_pos_ratio(p_name) -> float:
-    cash = database.get_cash(p_name)
-    # We use get_trades and calculate value since get_positional_val 
-    # might not be in the new database_sq.py yet
-    trades = database.get_trades(p_name)
-    pos_val = sum(t.value for t in trades)
+# `trades` below is the PortfolioArrays view of the portfolio snapshot;
+# `port_val` is computed once by the caller (trades.port_val(cash)) and shared
+def get_percent_exposure(trades, port_val) -> float:
+    exp = get_gross_exposure(trades)
+    return (exp / port_val) * 100 if port_val > 0 else 0.0
+
+def get_gross_exposure(trades) -> float:
+    return float(np.add.reduce(trades.max_loss))
+
+def get_cash_percent(cash, port_val) -> float:
+    return (cash / port_val * 100) if port_val > 0 else 0.0
+
+def get_cash_to_pos_ratio(trades, cash) -> float:
+    pos_val = float(np.add.reduce(trades.value))
     return (cash / pos_val) if pos_val > 0 else 1.0
 
-def get_leverage_ratio(p_name) -> float:
-    exposure = get_gross_exposure(p_name)
-    port_val = database.get_portfolio_val(p_name)
+def get_leverage_ratio(trades, port_val) -> float:
+    exposure = get_gross_exposure(trades)
     return (exposure / port_val) if port_val > 0 else 0.0
 
-def get_highest_pos_percent(p_name) -> float:
-    highest_val = 0.0
-    total_val = database.get_portfolio_val(p_name)
-    positions = database.get_trades(p_name)
-    for pos in positions:
-        if highest_val < pos.max_loss:
-            highest_val = pos.max_loss
-    return (highest_val / total_val * 100) if total_val > 0 else 0.0
+def get_highest_pos_percent(trades, port_val) -> float:
+    highest_val = max(float(trades.max_loss.max(initial=0.0)), 0.0)
+    return (highest_val / port_val * 100) if port_val > 0 else 0.0
 
-def get_hhi(p_name) -> float:
-    exp = get_gross_exposure(p_name)
-    hhi = 0.0
-    positions = database.get_trades(p_name)
+def get_hhi(trades) -> float:
+    exp = get_gross_exposure(trades)
 
-    if exp <= 0 or not positions:
+    if exp <= 0 or not len(trades):
         return 0.0
-    
-    tickers = {}
-    
-    for pos in positions:
-        if pos.ticker in tickers:
-            tickers[pos.ticker] += pos.max_loss
-        else:
-            tickers[pos.ticker] = pos.max_loss
-    
-    for ticker, loss in tickers.items():
-        ticker_weight = loss / exp
-        hhi += ticker_weight ** 2
-    
-    return hhi
+
+    # Per-ticker exposure in one pass, then the sum of squared weights
+    ticker_weights = np.bincount(trades.ticker_codes, weights=trades.max_loss) / exp
+    return float(np.square(ticker_weights).sum())
 
 def get_expected_returns(rets) -> float:
-    return sum(rets)
+    return float(np.sum(rets))
 
-def get_max_profit(p_name) -> float:
-    max_p = 0.0
-    positions = database.get_trades(p_name)
-    for pos in positions:
-        max_p += pos.max_gain
-    return max_p
+def get_max_profit(trades) -> float:
+    return float(np.add.reduce(trades.max_gain))
 
-def get_risk_reward_ratio(p_name) -> float:
-    max_p = get_max_profit(p_name)
-    max_l = get_gross_exposure(p_name)
+def get_risk_reward_ratio(trades) -> float:
+    max_p = get_max_profit(trades)
+    max_l = get_gross_exposure(trades)
     return (max_l / max_p) if max_p > 0 else 0.0
 
-def get_port_expected_return(p_name) -> float:
-    base = database.get_trades(p_name)
-    total_val_port = database.get_portfolio_val(p_name)
-
-    if total_val_port <= 0.0:
+def get_port_expected_return(trades, port_val) -> float:
+    if port_val <= 0.0:
         return 0.0
-    
-    expected_ret = 0.0
-
-    for pos in base:
-        if pos.value == 0.0 or pos.pnl_dist is None:
-            continue
-
-        pos_val = pos.value
-        expected_prof = pos.expected_profit
-        e_r = expected_prof / pos_val if pos_val > 0 else 0.0
-        w = pos_val / total_val_port
-        expected_ret += w * e_r
-    return expected_ret
 
-def get_port_downside_variance(p_name, target_return) -> float:
-    trades = database.get_trades(p_name)
-    total_val_port = database.get_portfolio_val(p_name)
+    # w * e_r = (val / total) * (profit / val) reduces to profit / total
+    held = trades.value > 0
+    return float(trades.expected_profit[held].sum() / port_val)
 
-    if total_val_port <= 0.0:
+def get_port_downside_variance(trades, port_val) -> float:
+    if port_val <= 0.0:
         return 0.0
-    
-    downside_var = 0.0
-
-    for pos in trades:
-        pos_val = pos.value
-        if pos_val <= 0 or pos.pnl_dist is None:
-            continue
 
-        w = pos_val / total_val_port
-        r = pos.pnl_dist
+    held = trades.value > 0
+    w = trades.value / port_val
 
-        # Downside deviation per Sortino definition
-        downside = np.minimum(0.0, r - target_return)
+    # Downside deviation per Sortino definition, against a 0 target (cached on each trade)
+    downside_sq = trades.downside_sq
 
-        # Portfolio aggregation (variance scales with w^2)
-        downside_var += (w ** 2) * np.mean(downside ** 2)
+    # Portfolio aggregation (variance scales with w^2)
+    return float((w[held] ** 2 * downside_sq[held]).sum())
 
-    return downside_var
-
-def get_sortino_ratio(p_name) -> float:
-    er = get_port_expected_return(p_name)
-    downside_var = get_port_downside_variance(p_name, 0.0)
+def get_sortino_ratio(trades, port_val) -> float:
+    er = get_port_expected_return(trades, port_val)
+    downside_var = get_port_downside_variance(trades, port_val)
 
     if downside_var <= 0:
         return 0.0
     
-    return er / np.sqrt(downside_var)
+    return float(er / np.sqrt(downside_var))
 
-def get_er_percent(ers, p_name) -> float:
+def get_er_percent(ers, port_val) -> float:
     er = get_expected_returns(ers)
-    port_val = database.get_portfolio_val(p_name)
     return (er / port_val) * 100 if port_val > 0 else 0.0
 
-def get_er_ann(p_name) -> float:
+def get_er_ann(trades, port_val) -> float:
     # Calculates weighted avg of ERPA across all non-stock positions
-    avg_er_ann = 0.0
-    port_val = database.get_portfolio_val(p_name)
-    positions = database.get_trades(p_name)
-
-    if len(positions) == 0 or port_val <= 0:
+    if len(trades) == 0 or port_val <= 0:
         return 0.0
 
-    for pos in positions:
-        if pos.trade_type not in ["shares", "cc"]:
-            # Check if pos_len is zero to avoid division by zero
-            days = pos.pos_len if pos.pos_len > 0 else 1
-            cycle_yield = pos.expected_profit / abs(pos.max_loss)
-            er_ann = cycle_yield * (365 / days)
-            w = abs(pos.max_loss) / port_val
-            avg_er_ann += w * er_ann
-    
-    return avg_er_ann
+    ann = ~np.isin(trades.trade_type, ("shares", "cc"))
+    # Check if pos_len is zero to avoid division by zero
+    days = np.where(trades.pos_len[ann] > 0, trades.pos_len[ann], 1)
+    risk = np.abs(trades.max_loss[ann])
+    cycle_yield = trades.expected_profit[ann] / risk
+    er_ann = cycle_yield * (365 / days)
+    w = risk / port_val
+    return float((w * er_ann).sum())
 
 # Util method for net liquidity
-def get_net_liquidity(p_name) -> float:
-    liq = database.get_cash(p_name)
-    positions = database.get_trades(p_name)
-    for pos in positions:
-        if pos.trade_type == "shares":
-            liq += pos.value
-    liq -= get_cost_to_close_shorts(positions)
-    liq += get_long_options_vals(positions)
+def get_net_liquidity(trades, cash) -> float:
+    liq = cash + float(trades.value[trades.trade_type == "shares"].sum())
+    liq -= get_cost_to_close_shorts(trades)
+    liq += get_long_options_vals(trades)
     return liq
 
 def get_cost_to_close_shorts(trades) -> float:
-    cost = 0.0
-    for trade in trades:
-        if trade.trade_type in ["csp", "cc", "short_call", "short_put"]:
-            price = trade.value - trade.expected_profit
-            cost += price
-    return cost
+    shorts = np.isin(trades.trade_type, ("csp", "cc", "short_call", "short_put"))
+    return float((trades.value - trades.expected_profit)[shorts].sum())
 
 def get_long_options_vals(trades) -> float:
-    cost = 0.0
-    for trade in trades:
-        if trade.trade_type in ["long_call", "long_put"]:
-            price = trade.value + trade.expected_profit
-            cost += price
-    return cost
+    longs = np.isin(trades.trade_type, ("long_call", "long_put"))
+    return float((trades.value + trades.expected_profit)[longs].sum())
 
 
 # Positional Metrics
-def get_percent_risk_position(position: Trade, p_name) -> float:
-    max_loss_port = database.get_portfolio_val(p_name)
+def get_percent_risk_position(position: Trade, port_val) -> float:
     max_loss_pos = position.max_loss
-    return (max_loss_pos / max_loss_port) * 100 if max_loss_port > 0 else 0.
+    return (max_loss_pos / port_val) * 100 if port_val > 0 else 0.
+
+# Portfolio P&L Distribution
+def aggregate_pnl(trades):
+    """
+    Sums every option trade's simulated P&L scenario-by-scenario into one buffer.
+    Shares are skipped (long horizon / skew, see the Visuals caption).
+    Trades simulated at different path counts are cut to the shortest one.
+    :return: Portfolio P&L array, or None if no option trade has a simulation
+    """
+    dists = [t.pnl_dist for t in trades if t.trade_type != "shares" and t.pnl_dist is not None]
+    if not dists:
+        return None
+    n = min(len(d) for d in dists)
+    acc = np.array(_fit_paths(dists[0], n), dtype=np.float32)  # owned copy we can add into
+    for d in dists[1:]:
+        np.add(acc, _fit_paths(d, n), out=acc)
+    return acc
+
+def _fit_paths(dist, sims):
+    """
+    Cuts an antithetic P&L array (z paths, then the matching -z paths) down to sims paths.
+    Takes the same leading paths from both halves so the kept set stays antithetic;
+    a plain prefix of an older 100k row would be all +z paths and biased.
+    """
+    if len(dist) == sims:
+        return dist
+    half, keep = len(dist) // 2, sims // 2
+    return np.concatenate((dist[:keep], dist[half:half + keep]))
+
+def get_pnl_stats(sims):
+    """
+    Mean, standard deviation and POP of a P&L array, using reductions rather than temporaries.
+    :return: (mean, std, percent of scenarios with profit)
+    """
+    n = sims.size
+    x = sims.astype(np.float64, copy=False)  # upcast once for the final moments
+    mean = np.add.reduce(x) / n
+    var = np.dot(x, x) / n - mean ** 2
+    return float(mean), float(np.sqrt(max(var, 0.0))), np.count_nonzero(sims > 0) / n * 100
 
 # Update Underlying Price for all Positions
 def update_underlyings(p_name):
     positions = database.get_trades(p_name)
 
-    # Limit API calls by building dict of tickers, prices
-    tickers_prices = {}
-    tickers_iv = {}
-    for pos in positions:
-        if pos.ticker in tickers_prices:
-            continue
-        tickers_prices[pos.ticker] = api.get_price(pos.ticker)
-        if pos.trade_type == "shares":
-            tickers_iv[pos.ticker] = api.get_historical_volatility(pos.ticker)
+    # One batched download covers prices and vols for every underlying
+    tickers_prices, tickers_iv = api.get_market_data(pos.ticker for pos in positions)
     
     for pos in positions:
         if tickers_prices[pos.ticker] > 0:
             pos.underlying_price = float(f"{tickers_prices[pos.ticker]:.2f}")
         if pos.trade_type == "shares" and pos.ticker in tickers_iv:
             pos.iv = tickers_iv[pos.ticker] 
-        pos.refresh_pnl()
-        database.store_trade(pos, p_name)
\ No newline at end of file
+
+    refresh_pnl_batch(positions)
+    database.store_trades(positions, p_name)
\ No newline at end of file